@@ -1,13 +1,17 @@
-from difflib import SequenceMatcher
 from typing import Dict
+import hashlib
+import html
+import os
+import sqlite3
 import streamlit as st
 import streamlit.components.v1 as components
 import nbformat
+import orjson
 from pathlib import Path
 import random
-import difflib
+from rapidfuzz import fuzz
 from rubric_analysis import do_rubric_check
-from starter_notebooks import StarterMatch, find_closest_starter, get_all_starter_versions, unified_diff
+from starter_notebooks import StarterMatch, find_closest_starter, get_all_starter_versions, grouped_opcodes, unified_diff
 
 st.set_page_config(
     layout="wide",
@@ -19,7 +23,6 @@ st.set_page_config(
 
 DATA_DIR = Path("data")
 SUBMISSIONS_DIR = DATA_DIR / "submissions"
-STARTERS_DIR = DATA_DIR / "starters"
 
 REPO_DIR = DATA_DIR / "cs-375-376-public"
 
@@ -30,32 +33,111 @@ def all_starter_versions() -> Dict[str, Dict[str, str]]:
     return get_all_starter_versions(REPO_DIR)
 
 
-def compute_diff_score(submission, starter):
-    """
-    Compute a similarity score between submission and starter notebooks.
-    Simple implementation that compares source code of all cells.
-    """
-    submission_code = '\n'.join(
-        cell.get('source', '') for cell in submission.cells
+@st.cache_resource
+def match_cache_db() -> sqlite3.Connection:
+    """Open the on-disk cache of starter-match decisions."""
+    conn = sqlite3.connect(DATA_DIR / "match_cache.db", check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS matches ("
+        " submission_hash TEXT NOT NULL,"
+        " starters_hash TEXT NOT NULL,"
+        " starter TEXT NOT NULL,"
+        " revision TEXT NOT NULL,"
+        " ratio REAL NOT NULL,"
+        " PRIMARY KEY (submission_hash, starters_hash))"
     )
-    starter_code = '\n'.join(
-        cell.get('source', '') for cell in starter.cells
+    return conn
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+@st.cache_resource
+def starter_set_hash() -> str:
+    """Hash identifying the current set of starter versions."""
+    versions = all_starter_versions()
+    keys = sorted(f"{name}:{rev}" for name, rev_map in versions.items() for rev in rev_map)
+    return _content_hash('\n'.join(keys))
+
+
+def find_closest_starter_cached(submission_quarto: str, versions) -> StarterMatch:
+    """Look up the starter match on disk, computing and storing it on a miss.
+
+    The picked starter only changes when the submission content or the
+    starter set changes, so after the first pass over a class, navigation
+    does no SequenceMatcher work at all.
+    """
+    conn = match_cache_db()
+    key = (_content_hash(submission_quarto), starter_set_hash())
+    row = conn.execute(
+        "SELECT starter, revision, ratio FROM matches"
+        " WHERE submission_hash = ? AND starters_hash = ?", key
+    ).fetchone()
+    if row is not None:
+        # The cache stores only the decision; rebuild opcodes for rendering.
+        starter_quarto = versions[row[0]][row[1]]
+        return StarterMatch(
+            starter=row[0], revision=row[1], ratio=row[2],
+            opcode_groups=grouped_opcodes(starter_quarto, submission_quarto),
+        )
+
+    match = find_closest_starter(submission_quarto, versions=versions)
+    conn.execute(
+        "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?)",
+        key + (match.starter, match.revision, match.ratio)
     )
-    
-    similarity = SequenceMatcher(None, submission_code, starter_code).ratio()
-    return 1 - similarity
+    conn.commit()
+    return match
+
+
+def compute_diff_score(submission_code: str, starter_code: str, best_score: float | None = None) -> float:
+    """
+    Compute a dissimilarity score between submission and starter texts.
+
+    Takes the already-joined Quarto strings (as cached by
+    load_submission_quarto / all_starter_versions) rather than notebook
+    objects, so no per-call pass over the cells is needed.
+
+    When scanning candidates, pass the best (lowest) score seen so far as
+    best_score: rapidfuzz then bails out inside C once a candidate can't
+    beat it, returning 1.0 for the losers.
+    """
+    if submission_code == starter_code:
+        return 0.0
+    cutoff = None if best_score is None else max(0.0, (1 - best_score) * 100)
+    return 1 - fuzz.ratio(submission_code, starter_code, score_cutoff=cutoff) / 100
+
+
+@st.cache_data(persist="disk")
+def load_submission_quarto(path: str, mtime: float) -> str:
+    """Load a submission notebook and convert it to Quarto, cached on (path, mtime)."""
+    submission = nbformat.read(path, as_version=4)
+    return notebook_to_quarto(submission)
+
+
+@st.cache_data(persist="disk", max_entries=2000)
+def _submission_and_starter(student: str, assignment: str, sub_mtime: float, starters_id: str, _versions) -> tuple[str, StarterMatch]:
+    """Cached on (student, assignment, submission mtime, starter set).
+
+    The versions dict itself is too big to hash on every rerun, so it's
+    passed unhashed and represented in the key by starters_id.
+    """
+    submission_path = SUBMISSIONS_DIR / assignment / f"{student}.ipynb"
+    submission_quarto = load_submission_quarto(str(submission_path), sub_mtime)
+    return submission_quarto, find_closest_starter_cached(submission_quarto, versions=_versions)
 
 
 def get_submission_and_starter(student, assignment, versions) -> tuple[str, StarterMatch]:
     """Get or compute diff for student's assignment."""
     submission_path = SUBMISSIONS_DIR / assignment / f"{student}.ipynb"
-    
+
     if not submission_path.exists():
         raise FileNotFoundError(f"Submission not found: {submission_path}")
-    
-    submission = nbformat.read(submission_path, as_version=4)
-    submission_quarto = notebook_to_quarto(submission)
-    return submission_quarto, find_closest_starter(submission_quarto, versions=versions)
+
+    return _submission_and_starter(
+        student, assignment, submission_path.stat().st_mtime, starter_set_hash(), versions
+    )
 
 
 def notebook_to_quarto(nb):
@@ -65,46 +147,63 @@ def notebook_to_quarto(nb):
         if cell.cell_type == 'markdown':
             chunks.append(cell.source)
         elif cell.cell_type == 'code':
-            chunks.append(f"```{{python}}\n{cell.source}\n```")
+            chunks.append('```{python}\n' + cell.source + '\n```')
     return '\n\n'.join(chunks)
 
 
-def generate_unified_diff_html(a, b, context=5):
-    """Generate HTML for a unified diff between two texts with collapsible common sections."""
+DIFF_CSS = """
+    pre { margin: 0; white-space: pre-wrap; }
+    .gap { width: 100%; color: #888; font-size: 10px; font-family: monospace; text-align: center; margin: 2px 0; }
+    .equal { background-color: white; font-size: 8px; }
+    .delete { background-color: #ffe6e6; }
+    .insert { background-color: #e6ffe6; }
+    .diff-container { display: flex; flex-flow: row wrap; }
+    .diff-group { border: 1px solid #ccc; margin: 5px 0; padding: 5px; font-size: 10px; font-family: monospace; overflow-x: auto; width: 49%;}
+"""
+
+
+def generate_unified_diff_html(a, b, ops):
+    """Generate HTML for a unified diff between two texts with collapsible common sections.
+
+    `ops` is a list of grouped opcodes (a as seq1, b as seq2), typically
+    computed once during starter matching and reused here.
+    """
     a_lines = a.splitlines()
     b_lines = b.splitlines()
-    ops = SequenceMatcher(None, a_lines, b_lines).get_grouped_opcodes(n=context)
 
     def format_chunk(lines, start, end):
-        if not lines[start:end]:
-            return ""
-        chunk = "\n".join(lines[start:end])
-        # Escape HTML characters
-        chunk = chunk.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        return chunk
-
-    html_out = ''
+        return html.escape("\n".join(lines[start:end]), quote=False)
+
+    def gap_marker(n_lines):
+        return f'<div class="gap">⋯ {n_lines} unchanged lines ⋯</div>'
+
+    parts = []
+    # Runs of unchanged lines between groups render as one summary node
+    # apiece rather than disappearing silently (or costing a node per line).
+    prev_end = 0
     for group in ops:
-        html_out += '<div class="diff-group">'
+        gap = group[0][1] - prev_end
+        if gap > 0:
+            parts.append(gap_marker(gap))
+        prev_end = group[-1][2]
+        parts.append('<div class="diff-group">')
         for tag, i1, i2, j1, j2 in group:
+            # One <pre> per opcode chunk keeps the DOM at a handful of
+            # nodes per group instead of one per line.
             if tag == 'equal':
-                html_out += f'<div class="equal">{format_chunk(a_lines, i1, i2)}</div>'
+                parts.append(f'<pre class="equal">{format_chunk(a_lines, i1, i2)}</pre>')
                 continue
             if tag in {'replace', 'delete'}:
-                html_out += f'<div class="delete">{format_chunk(a_lines, i1, i2)}</div>'
+                parts.append(f'<pre class="delete">{format_chunk(a_lines, i1, i2)}</pre>')
             if tag in {'replace', 'insert'}:
-                html_out += f'<div class="insert">{format_chunk(b_lines, j1, j2)}</div>'
-        html_out += '</div>'
-
-    custom_css = """
-        .equal { background-color: white; font-size: 8px; }
-        .delete { background-color: #ffe6e6; }
-        .insert { background-color: #e6ffe6; }
-        .diff-container { display: flex; flex-flow: row wrap; }
-        .diff-group { border: 1px solid #ccc; margin: 5px 0; padding: 5px; font-size: 10px; font-family: monospace; white-space: pre-wrap; overflow-x: auto; width: 49%;}
-    """
+                parts.append(f'<pre class="insert">{format_chunk(b_lines, j1, j2)}</pre>')
+        parts.append('</div>')
+    if len(a_lines) > prev_end:
+        parts.append(gap_marker(len(a_lines) - prev_end))
+    html_out = ''.join(parts)
+
     return f"""
-    <style>{custom_css}</style>
+    <style>{DIFF_CSS}</style>
     <div class="diff-container">
 {html_out}
     </div>
@@ -112,20 +211,40 @@ def generate_unified_diff_html(a, b, context=5):
 
 
 @st.cache_data
+def scan_submissions() -> tuple[list[str], list[str]]:
+    """List (assignments, students) under the submissions directory.
+
+    Prefers the _index.json maintained by utils/ingest_submissions.py (one
+    file read); falls back to a single os.scandir walk, where DirEntry's
+    is_dir() comes from the readdir buffer and avoids a stat() per entry.
+    """
+    index_path = SUBMISSIONS_DIR / "_index.json"
+    if index_path.exists():
+        index = orjson.loads(index_path.read_bytes())
+        students = set()
+        for assignment_students in index.values():
+            students.update(assignment_students)
+        return sorted(index), sorted(students)
+
+    assignments = []
+    students = set()
+    for assignment_entry in os.scandir(SUBMISSIONS_DIR):
+        if not assignment_entry.is_dir():
+            continue
+        assignments.append(assignment_entry.name)
+        for submission_entry in os.scandir(assignment_entry.path):
+            students.add(os.path.splitext(submission_entry.name)[0])
+    return sorted(assignments), sorted(students)
+
+
 def get_assignments():
     """Get list of assignments from submissions directory."""
-    return sorted([d.name for d in SUBMISSIONS_DIR.iterdir() if d.is_dir()])
+    return scan_submissions()[0]
 
 
-@st.cache_data
 def get_students():
     """Get list of all students who have submitted any assignments."""
-    students = set()
-    for assignment_dir in SUBMISSIONS_DIR.iterdir():
-        if not assignment_dir.is_dir():
-            continue
-        students.update(f.stem for f in assignment_dir.iterdir())
-    return sorted(students)
+    return scan_submissions()[1]
 
 
 def navigate_assignment(direction):
@@ -199,11 +318,20 @@ def main():
         versions = all_starter_versions()
         submission_quarto, match = get_submission_and_starter(selected_student, selected_assignment, versions=versions)
         starter_quarto = versions[match.starter][match.revision]
-        unified_diff_text = unified_diff(submission_quarto, starter_quarto, n_context_lines=9999)
     except FileNotFoundError as e:
         st.error(f"Error: {e}")
         return
 
+    if match.opcode_groups is None:
+        st.warning(
+            f"Submission or starter ({match.starter} @ {match.revision[:8]}) is too large "
+            "to diff responsively; showing the submission without alignment."
+        )
+        st.code(submission_quarto)
+        return
+
+    unified_diff_text = unified_diff(submission_quarto, starter_quarto, n_context_lines=9999)
+
     with st.expander("Rubric Check", expanded=False):
         rubric = st.text_area("Rubric", height=200)
         if st.button("Check against rubric"):
@@ -211,7 +339,7 @@ def main():
         
 
     # Display options
-    diff_html = generate_unified_diff_html(starter_quarto, submission_quarto)
+    diff_html = generate_unified_diff_html(starter_quarto, submission_quarto, match.opcode_groups)
 
     height = 800
     components.html(diff_html, height=height, scrolling=True)
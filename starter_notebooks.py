@@ -1,11 +1,16 @@
 import difflib
 import subprocess
+import sys
 from dataclasses import dataclass
+from difflib import SequenceMatcher
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List
 
 import nbformat
-from thefuzz import fuzz
+import orjson
+from nbformat.v4.nbjson import rejoin_lines
+from rapidfuzz import fuzz, process
 
 DEFAULT_REPO_URL = "https://github.com/Calvin-Data-Science/cs375-376-public"
 
@@ -17,10 +22,26 @@ def update_repo(repo_dir: Path, repo_url: str = DEFAULT_REPO_URL):
         subprocess.run(["git", "-C", str(repo_dir), "pull"], check=False)
 
 
+def _notebook_from_bytes(data: bytes) -> nbformat.NotebookNode:
+    """Parse notebook JSON quickly: orjson, no schema validation.
+
+    Starters are all nbformat v4, so the version-upgrade path of
+    nbformat.read isn't needed here.
+    """
+    nb = nbformat.from_dict(orjson.loads(data))
+    rejoin_lines(nb)  # on-disk JSON stores cell source as lists of lines
+    return nb
+
+
 def load_notebook(path: Path) -> nbformat.NotebookNode:
     """Load a notebook from a file path."""
-    with open(path, 'r') as f:
-        return nbformat.read(f, as_version=4)
+    return _notebook_from_bytes(path.read_bytes())
+
+
+@lru_cache(maxsize=None)
+def _load_notebook_quarto(path_str: str, mtime: float) -> str:
+    """Quarto text for a notebook file, cached on (path, mtime)."""
+    return notebook_to_quarto(load_notebook(Path(path_str)))
 
 
 def notebook_to_quarto(nb: nbformat.NotebookNode) -> str:
@@ -30,7 +51,7 @@ def notebook_to_quarto(nb: nbformat.NotebookNode) -> str:
         if cell.cell_type == 'markdown':
             chunks.append(cell.source)
         elif cell.cell_type == 'code':
-            chunks.append(f"```{{python}}\n{cell.source}\n```")
+            chunks.append('```{python}\n' + cell.source + '\n```')
     return '\n\n'.join(chunks)
 
 
@@ -40,8 +61,7 @@ def get_all_starters(repo_dir: Path, repo_url: str = DEFAULT_REPO_URL) -> Dict[s
     starters_dir = repo_dir / "notebooks"
     starters: Dict[str, str] = {}
     for starter in starters_dir.glob("*.ipynb"):
-        nb = load_notebook(starter)
-        starters[starter.stem] = notebook_to_quarto(nb)
+        starters[starter.stem] = _load_notebook_quarto(str(starter), starter.stat().st_mtime)
     return starters
 
 
@@ -60,22 +80,95 @@ def get_file_content_at_rev(repo_dir: Path, path: Path, rev: str) -> nbformat.No
     rel = str(path.relative_to(repo_dir))
     out = subprocess.run(
         ["git", "-C", str(repo_dir), "show", f"{rev}:{rel}"],
-        check=True, stdout=subprocess.PIPE, text=True
+        check=True, stdout=subprocess.PIPE
     )
-    return nbformat.reads(out.stdout, as_version=4)
+    return _notebook_from_bytes(out.stdout)
+
+
+def _object_shas_batch(repo_dir: Path, specs: List[str]) -> List[str]:
+    """Resolve many `<rev>:<path>` specs to object SHAs in one process.
+
+    Uses `cat-file --batch-check`, which reads only headers, so revisions
+    that didn't change a file can be deduped before fetching any content.
+    """
+    proc = subprocess.run(
+        ["git", "-C", str(repo_dir), "cat-file", "--batch-check"],
+        input=''.join(f"{spec}\n" for spec in specs).encode(),
+        stdout=subprocess.PIPE, check=True,
+    )
+    shas: List[str] = []
+    for spec, line in zip(specs, proc.stdout.decode().splitlines()):
+        fields = line.split()
+        if len(fields) != 3:  # "<spec> missing"
+            raise FileNotFoundError(f"Object not found in {repo_dir}: {spec}")
+        shas.append(fields[0])
+    return shas
+
+
+# Specs are fed to `cat-file --batch` this many at a time. Each chunk
+# stays well under the 64 KiB pipe buffer, and its replies are drained
+# before the next chunk is written, so neither side can block on a full
+# pipe no matter how many specs the caller passes.
+_CAT_FILE_CHUNK = 128
+
+
+def _read_blobs_batch(repo_dir: Path, specs: List[str]) -> List[bytes]:
+    """Read many git objects through a single `cat-file --batch` process.
+
+    `specs` are `<rev>:<path>` strings; returns the object bytes for each,
+    avoiding one fork/exec of `git show` per object.
+    """
+    proc = subprocess.Popen(
+        ["git", "-C", str(repo_dir), "cat-file", "--batch"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    assert proc.stdin is not None and proc.stdout is not None
+    blobs: List[bytes] = []
+    try:
+        for start in range(0, len(specs), _CAT_FILE_CHUNK):
+            chunk = specs[start:start + _CAT_FILE_CHUNK]
+            proc.stdin.write(''.join(f"{spec}\n" for spec in chunk).encode())
+            proc.stdin.flush()
+            for spec in chunk:
+                header = proc.stdout.readline().decode().split()
+                if len(header) != 3:  # "<spec> missing"
+                    raise FileNotFoundError(f"Object not found in {repo_dir}: {spec}")
+                size = int(header[2])
+                blobs.append(proc.stdout.read(size))
+                proc.stdout.read(1)  # trailing newline after each object
+        proc.stdin.close()
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    return blobs
 
 
 def get_all_starter_versions(repo_dir: Path, repo_url: str = DEFAULT_REPO_URL) -> Dict[str, Dict[str, str]]:
     """Map each starter notebook stem to a dict of revision SHA to Quarto text."""
     update_repo(repo_dir, repo_url)
     versions: Dict[str, Dict[str, str]] = {}
+    # Revisions that didn't change a file share its blob SHA, so each
+    # distinct blob is fetched, parsed and converted exactly once.
+    quarto_by_sha: Dict[str, str] = {}
     starters_dir = repo_dir / "notebooks"
     for ipynb in starters_dir.glob("*.ipynb"):
         name = ipynb.stem
-        versions[name] = {}
-        for rev in get_file_history(repo_dir, ipynb):
-            nb = get_file_content_at_rev(repo_dir, ipynb, rev)
-            versions[name][rev] = notebook_to_quarto(nb)
+        rel = str(ipynb.relative_to(repo_dir))
+        revs = get_file_history(repo_dir, ipynb)
+        specs = [f"{rev}:{rel}" for rev in revs]
+        shas = _object_shas_batch(repo_dir, specs)
+
+        new_sha_specs = {}
+        for spec, sha in zip(specs, shas):
+            if sha not in quarto_by_sha:
+                new_sha_specs.setdefault(sha, spec)
+        blobs = _read_blobs_batch(repo_dir, list(new_sha_specs.values()))
+        for sha, blob in zip(new_sha_specs, blobs):
+            quarto_by_sha[sha] = sys.intern(notebook_to_quarto(_notebook_from_bytes(blob)))
+
+        versions[name] = {rev: quarto_by_sha[sha] for rev, sha in zip(revs, shas)}
     return versions
 
 
@@ -85,6 +178,43 @@ class StarterMatch:
     starter: str
     revision: str
     ratio: float
+    # Grouped line-level opcodes (starter as seq1, submission as seq2),
+    # reusable for rendering without re-running the matcher.
+    opcode_groups: list | None = None
+
+
+def _is_junk_line(line: str) -> bool:
+    """Whitespace-only lines shouldn't seed diff alignment."""
+    return not line.strip()
+
+
+# Above these sizes the matcher can hang the app (huge embedded outputs,
+# logs, printed dataframes), so diff rendering bails out instead.
+MAX_DIFF_LINES = 5000
+MAX_DIFF_CHARS = 200_000
+
+
+def grouped_opcodes(starter_quarto: str, notebook_quarto: str, n_context_lines: int = 5) -> list | None:
+    """Grouped line-level opcodes between a starter and a submission.
+
+    Returns None when either text is too large to diff responsively.
+    """
+    if max(len(starter_quarto), len(notebook_quarto)) > MAX_DIFF_CHARS:
+        return None
+    starter_lines = starter_quarto.splitlines()
+    notebook_lines = notebook_quarto.splitlines()
+    if max(len(starter_lines), len(notebook_lines)) > MAX_DIFF_LINES:
+        return None
+    # Notebook lines have a small vocabulary (blank lines, common imports);
+    # interning turns the matcher's hashing into pointer comparisons and
+    # shrinks its b2j index.
+    matcher = SequenceMatcher(
+        _is_junk_line,
+        list(map(sys.intern, starter_lines)),
+        list(map(sys.intern, notebook_lines)),
+        autojunk=True,
+    )
+    return list(matcher.get_grouped_opcodes(n=n_context_lines))
 
 
 def unified_diff(notebook: str, starter: str, n_context_lines: int = 3) -> str:
@@ -100,19 +230,105 @@ def unified_diff(notebook: str, starter: str, n_context_lines: int = 3) -> str:
     )
 
 
+# How many shingle-prefiltered candidates get an exact similarity score.
+SHINGLE_TOP_K = 10
+
+
+def _shingles(text: str, k: int = 5) -> frozenset:
+    """Hashed k-word shingles of a Quarto text, for cheap Jaccard scoring."""
+    tokens = text.split()
+    return frozenset(hash(tuple(tokens[i:i + k])) for i in range(len(tokens) - k + 1))
+
+
+# Shingle sets are memoized for starter texts only: there's a fixed,
+# small set of those, whereas caching every submission ever matched
+# would grow without bound.
+_starter_shingles: Dict[str, frozenset] = {}
+
+
+def _starter_shingles_for(starter_quarto: str) -> frozenset:
+    shingles = _starter_shingles.get(starter_quarto)
+    if shingles is None:
+        shingles = _starter_shingles[starter_quarto] = _shingles(starter_quarto)
+    return shingles
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two sets; empty sets count as identical."""
+    union = len(a | b)
+    if union == 0:
+        return 1.0
+    return len(a & b) / union
+
+
+def _length_bound(len_a: int, len_b: int) -> float:
+    """Upper bound (0-100) on fuzz.ratio from the two lengths alone.
+
+    Indel distance is at least the length difference, so the similarity
+    can't exceed 2*min/(len_a+len_b).
+    """
+    total = len_a + len_b
+    if total == 0:
+        return 100.0
+    return 200.0 * min(len_a, len_b) / total
+
+
 def find_closest_starter(
     notebook_quarto: str,
-    versions: Dict[str, Dict[str, str]]
+    versions: Dict[str, Dict[str, str]],
+    n_context_lines: int = 5,
 ) -> StarterMatch:
     """Find the starter notebook version most similar to the given Quarto text."""
-    best: StarterMatch | None = None
-    best_ratio = -1.0
-    for name, rev_map in versions.items():
-        for rev, starter_quarto in rev_map.items():
-            ratio = fuzz.ratio(notebook_quarto, starter_quarto)
-            if ratio <= best_ratio:
-                continue
-            best_ratio = ratio
-            best = StarterMatch(starter=name, revision=rev, ratio=ratio)
-    assert best is not None, "No starter notebooks found"
-    return best
+    candidates = [
+        (name, rev, starter_quarto)
+        for name, rev_map in versions.items()
+        for rev, starter_quarto in rev_map.items()
+    ]
+    # Untouched starters are common; catch byte-identical submissions with
+    # plain equality (pointer-fast thanks to interning) before any scoring.
+    for name, rev, starter_quarto in candidates:
+        if starter_quarto == notebook_quarto:
+            return StarterMatch(
+                starter=name, revision=rev, ratio=1.0,
+                opcode_groups=grouped_opcodes(starter_quarto, notebook_quarto, n_context_lines),
+            )
+
+    # Shingle Jaccard is O(n) per candidate; use it to eliminate obviously
+    # wrong starters so only the top few pay for an exact similarity score.
+    if len(candidates) > SHINGLE_TOP_K:
+        notebook_shingles = _shingles(notebook_quarto)
+        candidates.sort(
+            key=lambda c: _jaccard(_starter_shingles_for(c[2]), notebook_shingles),
+            reverse=True,
+        )
+        candidates = candidates[:SHINGLE_TOP_K]
+
+    assert candidates, "No starter notebooks found"
+
+    # Establish a best-so-far from the closest-length candidate, then use
+    # the O(1) length bound on similarity to drop candidates that can't
+    # beat it before any scoring work.
+    len_nb = len(notebook_quarto)
+    candidates.sort(key=lambda c: abs(len(c[2]) - len_nb))
+    best_score = fuzz.ratio(notebook_quarto, candidates[0][2])
+    survivors = [
+        c for c in candidates[1:] if _length_bound(len_nb, len(c[2])) > best_score
+    ]
+    scores = [best_score]
+
+    if survivors:
+        # cdist parallelizes internally (workers=-1) with no pickling of
+        # the texts and the same score_cutoff pruning per pair.
+        survivor_scores = process.cdist(
+            [notebook_quarto], [c[2] for c in survivors],
+            scorer=fuzz.ratio, score_cutoff=best_score, workers=-1,
+        )[0]
+        scores += [float(score) for score in survivor_scores]
+
+    candidates = [candidates[0]] + survivors
+    best_idx = max(range(len(scores)), key=scores.__getitem__)
+    name, rev, starter_quarto = candidates[best_idx]
+    return StarterMatch(
+        starter=name, revision=rev, ratio=scores[best_idx] / 100,
+        opcode_groups=grouped_opcodes(starter_quarto, notebook_quarto, n_context_lines),
+    )
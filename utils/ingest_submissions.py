@@ -1,9 +1,32 @@
+import json
+import shutil
 import zipfile
 import os
 import re
 from pathlib import Path
 import click
 
+_PAREN_RE = re.compile(r'\(\d+\)$')
+_IPYNB_SUFFIX_RE = re.compile(r'-ipynb$')
+_ASSIGN_RE = re.compile(r'u\d{2}n\d-[^/]+$')
+
+SUBMISSIONS_DIR = Path('data/submissions')
+INDEX_PATH = SUBMISSIONS_DIR / '_index.json'
+
+def update_index(assignment_name, students):
+    """Merge an assignment's students into the submissions index.
+
+    The app reads this index ({assignment: [students...]}) instead of
+    rescanning every assignment directory. Written atomically via rename.
+    """
+    index = {}
+    if INDEX_PATH.exists():
+        index = json.loads(INDEX_PATH.read_text())
+    index[assignment_name] = sorted(set(index.get(assignment_name, [])) | set(students))
+    tmp_path = INDEX_PATH.with_suffix('.json.tmp')
+    tmp_path.write_text(json.dumps(index, indent=1))
+    tmp_path.replace(INDEX_PATH)
+
 def extract_student_name(path):
     """Extract student name from submission path."""
     # Example: "Fname Lname_1234_assignsubmission_file/notebook.ipynb"
@@ -15,11 +38,10 @@ def find_assignment_name(filenames):
     
     # Strip .ipynb extension once at the start and normalize filenames
     filenames = [Path(f).stem.strip() for f in filenames]
-    filenames = [re.sub(r'\(\d+\)$', '', f) for f in filenames]
-    filenames = [re.sub(r'-ipynb$', '', f) for f in filenames]
+    filenames = [_PAREN_RE.sub('', f) for f in filenames]
+    filenames = [_IPYNB_SUFFIX_RE.sub('', f) for f in filenames]
 
-    pattern = r'u\d{2}n\d-[^/]+$'
-    matches = sorted(set([f for f in filenames if re.search(pattern, f.lower())]))
+    matches = sorted(set([f for f in filenames if _ASSIGN_RE.search(f.lower())]))
     
     if len(matches) == 1:
         return matches[0]
@@ -34,7 +56,7 @@ def find_assignment_name(filenames):
     
     result = click.prompt("Please enter the assignment name to use")
     # make sure the result itself matches the pattern!
-    if not re.match(pattern, result):
+    if not _ASSIGN_RE.match(result):
         raise ValueError("Invalid assignment name")
     return result
 
@@ -62,17 +84,23 @@ def process_submission_zip(zipfile_path):
         assignment_name = find_assignment_name([Path(n).name for n in notebooks])
         
         # Create output directory
-        output_dir = Path('data/submissions') / assignment_name
+        output_dir = SUBMISSIONS_DIR / assignment_name
         output_dir.mkdir(parents=True, exist_ok=True)
-        
+
         # Process each notebook
+        students = []
         for notebook_path in notebooks:
             student_name = extract_student_name(notebook_path)
             output_path = output_dir / f"{student_name}.ipynb"
-            
+
             print(f"Extracting {student_name}'s notebook to {output_path}")
             with zf.open(notebook_path) as src, open(output_path, 'wb') as dst:
-                dst.write(src.read())
+                # Stream in 1 MiB chunks; notebooks with embedded images
+                # shouldn't be buffered whole in memory.
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            students.append(student_name)
+
+        update_index(assignment_name, students)
 
 if __name__ == '__main__':
     process_submissions()
\ No newline at end of file